@@ -22,7 +22,7 @@ DB_NAME = os.environ.get('DB_NAME', 'energy_market')
 def get_db_connection():
     return mysql.connector.connect(
         host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASSWORD,
-        database=DB_NAME, use_pure=True, connection_timeout=30
+        database=DB_NAME, connection_timeout=30
     )
 
 
@@ -264,7 +264,6 @@ def home():
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>enerlyzer - European Energy Market Dashboard</title>
-    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
     <style>
         """ + styles + """
         .controls {
@@ -328,6 +327,19 @@ def home():
         }
         .chart-title { font-size: 0.9rem; margin-bottom: 0.75rem; color: var(--text-muted); }
         .chart-container { height: 250px; }
+        .chart-container canvas { display: block; width: 100%; height: 100%; }
+        .chart-tooltip {
+            position: absolute;
+            display: none;
+            pointer-events: none;
+            background: var(--bg-dark);
+            border: 1px solid #2a3a4d;
+            border-radius: 6px;
+            padding: 0.35rem 0.6rem;
+            font-size: 0.8rem;
+            white-space: nowrap;
+            z-index: 200;
+        }
     </style>
 </head>
 <body>
@@ -427,9 +439,16 @@ def home():
             
     <script>
         let yearlyData = [], monthlyData = [], totalData = {};
-        let charts = {};
+        let lastChartData = {};
         const MONTHS = ['Jan','Feb','Mar','Apr','May','Jun','Jul','Aug','Sep','Oct','Nov','Dec'];
         const COLORS = ['#00f5d4','#f72585','#fee440','#ff6b35','#9d4edd','#4cc9f0'];
+        const zoneSelect = document.getElementById('zoneSelect');
+        const monthSelect = document.getElementById('monthSelect');
+        const statEls = [1,2,3,4,5,6].map(i => document.getElementById('val' + i));
+        const canvases = [1,2,3,4,5,6].map(i => document.getElementById('chart' + i));
+        
+        const METRICS = ['neg_hours','avg_market_price','capture_price','capture_price_floor0','capture_rate','solar_at_neg_price_pct'];
+        let topYearly = [], monthlyByZone = new Map(), monthlyByMonth = new Map();
         
         async function loadData() {
             const [t, y, m] = await Promise.all([
@@ -438,105 +457,192 @@ def home():
                 fetch('/api/summary/monthly').then(r => r.json())
             ]);
             totalData = t; yearlyData = y.data; monthlyData = m.data;
+            
+            // Group once at load so every selection is a lookup, not a filter/sort pass
+            topYearly = [...yearlyData].sort((a,b) => b.neg_hours - a.neg_hours).slice(0, 12);
+            for (const x of monthlyData) {
+                if (!monthlyByZone.has(x.country)) monthlyByZone.set(x.country, []);
+                if (!monthlyByMonth.has(x.month)) monthlyByMonth.set(x.month, []);
+                monthlyByZone.get(x.country).push(x);
+                monthlyByMonth.get(x.month).push(x);
+            }
+            for (const rows of monthlyByZone.values()) rows.sort((a,b) => a.month - b.month);
+            for (const rows of monthlyByMonth.values()) rows.sort((a,b) => b.neg_hours - a.neg_hours);
             updateDisplay();
         }
         
+        // Single pass: neg_hours is summed, every other metric is averaged
+        function summarize(rows) {
+            const d = {};
+            for (const k of METRICS) d[k] = 0;
+            for (const x of rows) for (const k of METRICS) d[k] += x[k];
+            if (rows.length) for (const k of METRICS.slice(1)) d[k] /= rows.length;
+            return d;
+        }
+        
+        // Single pass over rows building all six chart series
+        function toDatasets(rows) {
+            const datasets = METRICS.map(() => new Array(rows.length));
+            rows.forEach((x, i) => { for (let j = 0; j < 6; j++) datasets[j][i] = x[METRICS[j]]; });
+            return datasets;
+        }
+        
+        // Bumped on every update so a slow daily fetch cannot overwrite a newer selection
+        let displaySeq = 0;
+        
         async function updateDisplay() {
-            const zone = document.getElementById('zoneSelect').value;
-            const month = document.getElementById('monthSelect').value;
-            let d, labels, datasets;
+            const seq = ++displaySeq;
+            const zone = zoneSelect.value;
+            const month = monthSelect.value;
+            let d, labels, rows;
             
             if (zone === 'all' && month === 'all') {
                 d = totalData;
-                const sorted = [...yearlyData].sort((a,b) => b.neg_hours - a.neg_hours).slice(0, 12);
-                labels = sorted.map(x => x.country.substring(0, 12));
-                datasets = [
-                    sorted.map(x => x.neg_hours), sorted.map(x => x.avg_market_price),
-                    sorted.map(x => x.capture_price), sorted.map(x => x.capture_price_floor0),
-                    sorted.map(x => x.capture_rate), sorted.map(x => x.solar_at_neg_price_pct)
-                ];
+                rows = topYearly;
+                labels = rows.map(x => x.country.substring(0, 12));
             } else if (zone !== 'all' && month === 'all') {
-                const yd = yearlyData.find(x => x.country === zone) || {};
-                d = { neg_hours: yd.neg_hours||0, avg_market_price: yd.avg_market_price||0,
-                      capture_price: yd.capture_price||0, capture_price_floor0: yd.capture_price_floor0||0,
-                      capture_rate: yd.capture_rate||0, solar_at_neg_price_pct: yd.solar_at_neg_price_pct||0 };
-                const md = monthlyData.filter(x => x.country === zone).sort((a,b) => a.month - b.month);
-                labels = md.map(x => MONTHS[x.month - 1]);
-                datasets = [
-                    md.map(x => x.neg_hours), md.map(x => x.avg_market_price),
-                    md.map(x => x.capture_price), md.map(x => x.capture_price_floor0),
-                    md.map(x => x.capture_rate), md.map(x => x.solar_at_neg_price_pct)
-                ];
+                d = yearlyData.find(x => x.country === zone) || {};
+                rows = monthlyByZone.get(zone) || [];
+                labels = rows.map(x => MONTHS[x.month - 1]);
             } else if (zone === 'all' && month !== 'all') {
-                const md = monthlyData.filter(x => x.month === parseInt(month));
-                d = {
-                    neg_hours: md.reduce((s,x) => s + x.neg_hours, 0),
-                    avg_market_price: md.length ? md.reduce((s,x) => s + x.avg_market_price, 0) / md.length : 0,
-                    capture_price: md.length ? md.reduce((s,x) => s + x.capture_price, 0) / md.length : 0,
-                    capture_price_floor0: md.length ? md.reduce((s,x) => s + x.capture_price_floor0, 0) / md.length : 0,
-                    capture_rate: md.length ? md.reduce((s,x) => s + x.capture_rate, 0) / md.length : 0,
-                    solar_at_neg_price_pct: md.length ? md.reduce((s,x) => s + x.solar_at_neg_price_pct, 0) / md.length : 0
-                };
-                const sorted = [...md].sort((a,b) => b.neg_hours - a.neg_hours).slice(0, 12);
-                labels = sorted.map(x => x.country.substring(0, 12));
-                datasets = [
-                    sorted.map(x => x.neg_hours), sorted.map(x => x.avg_market_price),
-                    sorted.map(x => x.capture_price), sorted.map(x => x.capture_price_floor0),
-                    sorted.map(x => x.capture_rate), sorted.map(x => x.solar_at_neg_price_pct)
-                ];
+                const md = monthlyByMonth.get(parseInt(month)) || [];
+                d = summarize(md);
+                rows = md.slice(0, 12);
+                labels = rows.map(x => x.country.substring(0, 12));
             } else {
                 const dailyRes = await fetch(`/api/summary/daily?country=${encodeURIComponent(zone)}&month=${month}`);
-                const dailyData = (await dailyRes.json()).data;
-                
-                d = {
-                    neg_hours: dailyData.reduce((s,x) => s + x.neg_hours, 0),
-                    avg_market_price: dailyData.length ? dailyData.reduce((s,x) => s + x.avg_market_price, 0) / dailyData.length : 0,
-                    capture_price: dailyData.length ? dailyData.reduce((s,x) => s + x.capture_price, 0) / dailyData.length : 0,
-                    capture_price_floor0: dailyData.length ? dailyData.reduce((s,x) => s + x.capture_price_floor0, 0) / dailyData.length : 0,
-                    capture_rate: dailyData.length ? dailyData.reduce((s,x) => s + x.capture_rate, 0) / dailyData.length : 0,
-                    solar_at_neg_price_pct: dailyData.length ? dailyData.reduce((s,x) => s + x.solar_at_neg_price_pct, 0) / dailyData.length : 0
-                };
-                
-                const sorted = dailyData.sort((a,b) => a.day - b.day);
-                labels = sorted.map(x => x.day.toString());
-                datasets = [
-                    sorted.map(x => x.neg_hours), sorted.map(x => x.avg_market_price),
-                    sorted.map(x => x.capture_price), sorted.map(x => x.capture_price_floor0),
-                    sorted.map(x => x.capture_rate), sorted.map(x => x.solar_at_neg_price_pct)
-                ];
+                const dailyJson = await dailyRes.json();
+                if (seq !== displaySeq) return;
+                rows = dailyJson.data.sort((a,b) => a.day - b.day);
+                d = summarize(rows);
+                labels = rows.map(x => x.day.toString());
             }
             
-            document.getElementById('val1').textContent = (d.neg_hours||0).toFixed(1) + ' hrs';
-            document.getElementById('val2').textContent = '€' + (d.avg_market_price||0).toFixed(2);
-            document.getElementById('val3').textContent = '€' + (d.capture_price||0).toFixed(2);
-            document.getElementById('val4').textContent = '€' + (d.capture_price_floor0||0).toFixed(2);
-            document.getElementById('val5').textContent = (d.capture_rate||0).toFixed(1) + '%';
-            document.getElementById('val6').textContent = (d.solar_at_neg_price_pct||0).toFixed(1) + '%';
+            statEls[0].textContent = (d.neg_hours||0).toFixed(1) + ' hrs';
+            statEls[1].textContent = '€' + (d.avg_market_price||0).toFixed(2);
+            statEls[2].textContent = '€' + (d.capture_price||0).toFixed(2);
+            statEls[3].textContent = '€' + (d.capture_price_floor0||0).toFixed(2);
+            statEls[4].textContent = (d.capture_rate||0).toFixed(1) + '%';
+            statEls[5].textContent = (d.solar_at_neg_price_pct||0).toFixed(1) + '%';
             
-            updateCharts(labels, datasets);
+            updateCharts(labels, toDatasets(rows));
         }
         
+        // Minimal canvas bar renderer: one-shot draw per update, no animation loop
+        const AXIS_COLOR = '#8892a0', GRID_COLOR = '#2a3a4d';
+        const CHART_FONT = "11px 'Segoe UI', system-ui, sans-serif";
+        const PAD = { top: 10, right: 10, left: 48 };
+        const LABEL_GAP = 6, LABEL_HEIGHT = 13;
+        const tooltip = document.createElement('div');
+        tooltip.className = 'chart-tooltip';
+        document.body.appendChild(tooltip);
+
+        function niceStep(range, ticks) {
+            const raw = range / ticks;
+            const mag = Math.pow(10, Math.floor(Math.log10(raw)));
+            const norm = raw / mag;
+            return (norm <= 1 ? 1 : norm <= 2 ? 2 : norm <= 5 ? 5 : 10) * mag;
+        }
+
+        function drawBars(canvas, labels, data, color, bgColor) {
+            const dpr = window.devicePixelRatio || 1;
+            const w = canvas.clientWidth, h = canvas.clientHeight;
+            canvas.width = w * dpr; canvas.height = h * dpr;
+            const ctx = canvas.getContext('2d');
+            ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+            ctx.clearRect(0, 0, w, h);
+            ctx.font = CHART_FONT;
+
+            let min = 0, max = 0;
+            for (const v of data) { if (v < min) min = v; if (v > max) max = v; }
+            if (min === max) max = 1;
+            const step = niceStep(max - min, 5);
+            min = Math.floor(min / step) * step;
+            max = Math.ceil(max / step) * step;
+
+            // X-axis labels are rotated when they do not fit their slot; the
+            // bottom padding is sized from the widest label either way
+            const plotW = w - PAD.left - PAD.right;
+            const n = data.length, slot = n ? plotW / n : plotW, barW = slot * 0.8;
+            let widest = 0;
+            for (const l of labels) widest = Math.max(widest, ctx.measureText(l).width);
+            const rotate = widest > slot - 4;
+            const labelDrop = rotate ? Math.ceil((widest + LABEL_HEIGHT / 2) * Math.SQRT1_2) : LABEL_HEIGHT;
+            const bottom = Math.min(LABEL_GAP + labelDrop + 2, h / 2);
+            const plotH = h - PAD.top - bottom;
+            const y = v => PAD.top + (max - v) / (max - min) * plotH;
+
+            // Grid lines and y-axis ticks
+            ctx.strokeStyle = GRID_COLOR; ctx.fillStyle = AXIS_COLOR; ctx.lineWidth = 1;
+            ctx.textAlign = 'right'; ctx.textBaseline = 'middle';
+            const decimals = step < 1 ? Math.min(2, Math.ceil(-Math.log10(step))) : 0;
+            for (let v = min; v <= max + step / 2; v += step) {
+                const gy = Math.round(y(v)) + 0.5;
+                ctx.beginPath(); ctx.moveTo(PAD.left, gy); ctx.lineTo(w - PAD.right, gy); ctx.stroke();
+                ctx.fillText(v.toFixed(decimals), PAD.left - 6, gy);
+            }
+
+            // Bars
+            const y0 = y(0);
+            ctx.fillStyle = bgColor; ctx.strokeStyle = color;
+            for (let i = 0; i < n; i++) {
+                const x = PAD.left + i * slot + (slot - barW) / 2;
+                const top = Math.min(y0, y(data[i])), bh = Math.abs(y(data[i]) - y0);
+                ctx.fillRect(x, top, barW, bh);
+                ctx.strokeRect(x + 0.5, top + 0.5, barW - 1, Math.max(bh - 1, 0));
+            }
+
+            // X-axis labels
+            ctx.fillStyle = AXIS_COLOR;
+            for (let i = 0; i < n; i++) {
+                const cx = PAD.left + i * slot + slot / 2, cy = PAD.top + plotH + LABEL_GAP;
+                ctx.save(); ctx.translate(cx, cy);
+                if (rotate) { ctx.rotate(-Math.PI / 4); ctx.textAlign = 'right'; ctx.textBaseline = 'middle'; }
+                else { ctx.textAlign = 'center'; ctx.textBaseline = 'top'; }
+                ctx.fillText(labels[i], 0, 0);
+                ctx.restore();
+            }
+
+            canvas._bars = { labels, data, slot };
+        }
+
+        function showTooltip(e) {
+            const bars = e.target._bars;
+            if (!bars) return;
+            const x = e.offsetX - PAD.left;
+            const i = Math.floor(x / bars.slot);
+            if (x < 0 || i >= bars.data.length) { tooltip.style.display = 'none'; return; }
+            tooltip.textContent = bars.labels[i] + ': ' + bars.data[i].toFixed(2);
+            tooltip.style.left = (e.pageX + 12) + 'px';
+            tooltip.style.top = (e.pageY - 28) + 'px';
+            tooltip.style.display = 'block';
+        }
+
+        for (const canvas of canvases) {
+            canvas.addEventListener('mousemove', showTooltip);
+            canvas.addEventListener('mouseleave', () => { tooltip.style.display = 'none'; });
+        }
+
         function updateCharts(labels, datasets) {
-            const opts = {
-                responsive: true, maintainAspectRatio: false,
-                plugins: { legend: { display: false } },
-                    scales: {
-                    x: { ticks: { color: '#8892a0', maxRotation: 45 }, grid: { color: '#2a3a4d' } },
-                    y: { ticks: { color: '#8892a0' }, grid: { color: '#2a3a4d' } }
-                }
-            };
+            lastChartData = { labels, datasets };
             for (let i = 0; i < 6; i++) {
-                if (charts[i]) charts[i].destroy();
-                charts[i] = new Chart(document.getElementById('chart' + (i+1)), {
-                type: 'bar',
-                    data: { labels, datasets: [{ data: datasets[i], backgroundColor: COLORS[i] + '99', borderColor: COLORS[i], borderWidth: 1 }] },
-                    options: opts
-                });
+                drawBars(canvases[i], labels, datasets[i], COLORS[i], COLORS[i] + '99');
             }
         }
+
+        window.addEventListener('resize', () => {
+            if (lastChartData.labels) updateCharts(lastChartData.labels, lastChartData.datasets);
+        });
+        
+        // Coalesce rapid selection changes into at most one update per frame
+        let pendingUpdate = 0;
+        function scheduleUpdate() {
+            if (pendingUpdate) return;
+            pendingUpdate = requestAnimationFrame(() => { pendingUpdate = 0; updateDisplay(); });
+        }
         
-        document.getElementById('zoneSelect').addEventListener('change', updateDisplay);
-        document.getElementById('monthSelect').addEventListener('change', updateDisplay);
+        zoneSelect.addEventListener('change', scheduleUpdate);
+        monthSelect.addEventListener('change', scheduleUpdate);
         loadData();
     </script>
 </body>
@@ -8,9 +8,14 @@ Designed to run as a Cloud Run Job triggered by Cloud Scheduler.
 import os
 import sys
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-import mysql.connector
+from functools import lru_cache
+from mysql.connector import pooling
+import threading
 import time
 
 # =============================================================================
@@ -20,16 +25,29 @@ import time
 ENTSOE_API_TOKEN = os.environ.get('ENTSOE_API_TOKEN', '')
 ENTSOE_BASE_URL = "https://web-api.tp.entsoe.eu/api"
 
+# Zones fetched concurrently; kept low to stay within ENTSO-E's rate limit
+FETCH_WORKERS = 4
+
+# ENTSO-E allows 400 requests/minute per token; requests are spaced across all
+# workers to stay below that, and 429 Retry-After is honoured by the retry policy
+MAX_REQUESTS_PER_SECOND = 5
+
 DB_CONFIG = {
     'host': os.environ['DB_HOST'],
     'port': int(os.environ.get('DB_PORT', '3306')),
     'user': os.environ['DB_USER'],
     'password': os.environ['DB_PASSWORD'],
     'database': os.environ.get('DB_NAME', 'energy_market'),
-    'use_pure': True,
     'connection_timeout': 300,
 }
 
+# The insert pass and the summary rebuild run one after the other, and the pool
+# opens every connection up front, so a single connection is enough
+DB_POOL_SIZE = 1
+
+# Rows per multi-row INSERT; keeps each statement well under max_allowed_packet
+INSERT_BATCH_SIZE = 5000
+
 PRODUCTION_TYPES = {
     'B16': 'Solar',
     'B18': 'Wind Offshore', 
@@ -76,9 +94,17 @@ BIDDING_ZONES = {
 # HELPER FUNCTIONS
 # =============================================================================
 
+_db_pool = None
+
 def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+    """Borrow a pooled connection; close() hands it back to the pool"""
+    global _db_pool
+    if _db_pool is None:
+        _db_pool = pooling.MySQLConnectionPool(
+            pool_name='entsoe', pool_size=DB_POOL_SIZE, **DB_CONFIG)
+    return _db_pool.get_connection()
 
+@lru_cache(maxsize=1024)
 def parse_datetime(dt_str):
     try:
         return datetime.strptime(dt_str.replace('Z', ''), '%Y-%m-%dT%H:%M')
@@ -88,10 +114,61 @@ def parse_datetime(dt_str):
 def format_period(dt):
     return dt.strftime('%Y%m%d%H%M')
 
+# Every zone reports the same period starts and positions, so after the first
+# zone nearly every Point's timestamp is a cache hit
+@lru_cache(maxsize=8192)
+def point_timestamp(period_start, offset_minutes):
+    """Return the DB timestamp string and month for a Point"""
+    timestamp = period_start + timedelta(minutes=offset_minutes)
+    return timestamp.strftime('%Y-%m-%d %H:%M:%S'), timestamp.month
+
+def iter_periods(xml_file, ns):
+    """Stream (TimeSeries, Period) pairs, freeing each TimeSeries once parsed"""
+    ts_tag = ns + 'TimeSeries'
+    period_tag = ns + 'Period'
+    context = ET.iterparse(xml_file, events=('start', 'end'))
+    _, root = next(context)
+    timeseries = None
+    for event, elem in context:
+        if event == 'start':
+            if elem.tag == ts_tag:
+                timeseries = elem
+        elif elem.tag == period_tag:
+            yield timeseries, elem
+            elem.clear()
+        elif elem.tag == ts_tag:
+            root.clear()
+
 # =============================================================================
 # ENTSO-E API FUNCTIONS
 # =============================================================================
 
+# Namespace prefixes in ElementTree's {uri}tag form; matching on full tag names
+# skips the per-call prefix resolution of find(path, namespaces)
+PRICE_NS = '{urn:iec62325.351:tc57wg16:451-3:publicationdocument:7:3}'
+GEN_NS = '{urn:iec62325.351:tc57wg16:451-6:generationloaddocument:3:0}'
+
+# Shared session so worker threads reuse keep-alive TLS connections;
+# transient ENTSO-E errors are retried with exponential backoff
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=16, pool_maxsize=16,
+    max_retries=Retry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504]),
+))
+
+_rate_lock = threading.Lock()
+_next_request_at = 0.0
+
+def wait_for_rate_limit():
+    """Block until the next request slot, shared across fetch threads"""
+    global _next_request_at
+    with _rate_lock:
+        now = time.monotonic()
+        wait = _next_request_at - now
+        _next_request_at = max(now, _next_request_at) + 1 / MAX_REQUESTS_PER_SECOND
+    if wait > 0:
+        time.sleep(wait)
+
 def fetch_day_ahead_prices(area_code, start_date, end_date):
     params = {
         'securityToken': ENTSOE_API_TOKEN,
@@ -103,52 +180,54 @@ def fetch_day_ahead_prices(area_code, start_date, end_date):
     }
     
     try:
-        response = requests.get(ENTSOE_BASE_URL, params=params, timeout=60)
-        if response.status_code == 200:
-            return parse_price_xml(response.text, area_code)
+        wait_for_rate_limit()
+        # Parse straight off the socket so decoding overlaps the download
+        with SESSION.get(ENTSOE_BASE_URL, params=params, timeout=60, stream=True) as response:
+            if response.status_code == 200:
+                response.raw.decode_content = True
+                return parse_price_xml(response.raw, area_code)
         return []
     except Exception as e:
         print(f"   ❌ API error: {e}")
         return []
 
-def parse_price_xml(xml_text, area_code):
+def parse_price_xml(xml_file, area_code):
     prices = []
     try:
-        root = ET.fromstring(xml_text)
-        ns = {'ns': 'urn:iec62325.351:tc57wg16:451-3:publicationdocument:7:3'}
         area_name = BIDDING_ZONES.get(area_code, area_code)
+        start_path = f'{PRICE_NS}timeInterval/{PRICE_NS}start'
+        point_tag = PRICE_NS + 'Point'
+        position_tag = PRICE_NS + 'position'
+        amount_tag = PRICE_NS + 'price.amount'
         
-        for timeseries in root.findall('.//ns:TimeSeries', ns):
-            currency = timeseries.find('.//ns:currency_Unit.name', ns)
-            for period in timeseries.findall('.//ns:Period', ns):
-                start_elem = period.find('.//ns:timeInterval/ns:start', ns)
-                resolution = period.find('.//ns:resolution', ns)
-                if start_elem is None:
-                    continue
-                period_start = parse_datetime(start_elem.text)
-                res_code = 'PT60M'
-                res_minutes = 60
-                if resolution is not None and 'PT15M' in resolution.text:
-                    res_minutes = 15
-                    res_code = 'PT15M'
-                
-                for point in period.findall('.//ns:Point', ns):
-                    position = int(point.find('ns:position', ns).text)
-                    price_elem = point.find('ns:price.amount', ns)
-                    if price_elem is not None:
-                        price = float(price_elem.text)
-                        timestamp = period_start + timedelta(minutes=(position - 1) * res_minutes)
-                        prices.append({
-                            'datetime_utc': timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                            'area_code': area_code,
-                            'area_name': area_name,
-                            'price': price,
-                            'resolution': res_code,
-                            'currency': currency.text if currency is not None else 'EUR',
-                            'month': timestamp.month,
-                        })
+        for timeseries, period in iter_periods(xml_file, PRICE_NS):
+            currency = timeseries.find(PRICE_NS + 'currency_Unit.name')
+            currency = currency.text if currency is not None else 'EUR'
+            start_elem = period.find(start_path)
+            resolution = period.find(PRICE_NS + 'resolution')
+            if start_elem is None:
+                continue
+            period_start = parse_datetime(start_elem.text)
+            res_code = 'PT60M'
+            res_minutes = 60
+            if resolution is not None and 'PT15M' in resolution.text:
+                res_minutes = 15
+                res_code = 'PT15M'
+            
+            for point in period.iter(point_tag):
+                position = int(point.find(position_tag).text)
+                price_elem = point.find(amount_tag)
+                if price_elem is not None:
+                    price = float(price_elem.text)
+                    timestamp, month = point_timestamp(period_start, (position - 1) * res_minutes)
+                    prices.append((
+                        timestamp, area_code, area_name,
+                        price, res_code, currency, month,
+                    ))
     except ET.ParseError as e:
+        # Rows streamed before the error belong to a broken document; drop them all
         print(f"   ⚠️ XML parse error: {e}")
+        return []
     return prices
 
 def fetch_generation(area_code, psr_type, start_date, end_date):
@@ -163,62 +242,61 @@ def fetch_generation(area_code, psr_type, start_date, end_date):
     }
     
     try:
-        response = requests.get(ENTSOE_BASE_URL, params=params, timeout=60)
-        if response.status_code == 200:
-            return parse_generation_xml(response.text, area_code, psr_type)
+        wait_for_rate_limit()
+        with SESSION.get(ENTSOE_BASE_URL, params=params, timeout=60, stream=True) as response:
+            if response.status_code == 200:
+                response.raw.decode_content = True
+                return parse_generation_xml(response.raw, area_code, psr_type)
         return []
     except Exception as e:
         print(f"   ❌ API error: {e}")
         return []
 
-def parse_generation_xml(xml_text, area_code, psr_type):
+def parse_generation_xml(xml_file, area_code, psr_type):
     generation = []
     try:
-        root = ET.fromstring(xml_text)
-        ns = {'ns': 'urn:iec62325.351:tc57wg16:451-6:generationloaddocument:3:0'}
         area_name = BIDDING_ZONES.get(area_code, area_code)
+        production_type = PRODUCTION_TYPES.get(psr_type, psr_type)
+        start_path = f'{GEN_NS}timeInterval/{GEN_NS}start'
+        point_tag = GEN_NS + 'Point'
+        position_tag = GEN_NS + 'position'
+        quantity_tag = GEN_NS + 'quantity'
         
-        for timeseries in root.findall('.//ns:TimeSeries', ns):
-            for period in timeseries.findall('.//ns:Period', ns):
-                start_elem = period.find('.//ns:timeInterval/ns:start', ns)
-                resolution = period.find('.//ns:resolution', ns)
-                if start_elem is None:
-                    continue
-                period_start = parse_datetime(start_elem.text)
-                res_code = 'PT60M'
-                res_minutes = 60
-                if resolution is not None and 'PT15M' in resolution.text:
-                    res_minutes = 15
-                    res_code = 'PT15M'
-                
-                for point in period.findall('.//ns:Point', ns):
-                    position = int(point.find('ns:position', ns).text)
-                    quantity = point.find('ns:quantity', ns)
-                    if quantity is not None:
-                        output = float(quantity.text)
-                        timestamp = period_start + timedelta(minutes=(position - 1) * res_minutes)
-                        generation.append({
-                            'datetime': timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                            'area_code': area_code,
-                            'area_name': area_name,
-                            'production_type': PRODUCTION_TYPES.get(psr_type, psr_type),
-                            'output': output,
-                            'resolution': res_code,
-                            'month': timestamp.month,
-                        })
+        for _, period in iter_periods(xml_file, GEN_NS):
+            start_elem = period.find(start_path)
+            resolution = period.find(GEN_NS + 'resolution')
+            if start_elem is None:
+                continue
+            period_start = parse_datetime(start_elem.text)
+            res_code = 'PT60M'
+            res_minutes = 60
+            if resolution is not None and 'PT15M' in resolution.text:
+                res_minutes = 15
+                res_code = 'PT15M'
+            
+            for point in period.iter(point_tag):
+                position = int(point.find(position_tag).text)
+                quantity = point.find(quantity_tag)
+                if quantity is not None:
+                    output = float(quantity.text)
+                    timestamp, month = point_timestamp(period_start, (position - 1) * res_minutes)
+                    generation.append((
+                        timestamp, area_code, area_name,
+                        production_type, output, res_code, month,
+                    ))
     except ET.ParseError as e:
+        # Rows streamed before the error belong to a broken document; drop them all
         print(f"   ⚠️ XML parse error: {e}")
+        return []
     return generation
 
 # =============================================================================
 # DATABASE FUNCTIONS
 # =============================================================================
 
-def insert_prices(prices):
+def insert_prices(cursor, prices):
     if not prices:
         return 0
-    conn = get_db_connection()
-    cursor = conn.cursor()
     
     insert_sql = """
     INSERT IGNORE INTO energy_prices 
@@ -227,25 +305,15 @@ def insert_prices(prices):
     VALUES (%s, %s, %s, %s, %s, %s, 'Day-ahead', %s)
     """
     
-    batch = []
-    for p in prices:
-        batch.append((
-            p['datetime_utc'], p['area_code'], p['area_name'],
-            p['price'], p['resolution'], p['currency'], p['month']
-        ))
-    
-    cursor.executemany(insert_sql, batch)
-    conn.commit()
-    inserted = cursor.rowcount
-    cursor.close()
-    conn.close()
+    inserted = 0
+    for i in range(0, len(prices), INSERT_BATCH_SIZE):
+        cursor.executemany(insert_sql, prices[i:i + INSERT_BATCH_SIZE])
+        inserted += cursor.rowcount
     return inserted
 
-def insert_generation(generation_data):
+def insert_generation(cursor, generation_data):
     if not generation_data:
         return 0
-    conn = get_db_connection()
-    cursor = conn.cursor()
     
     insert_sql = """
     INSERT IGNORE INTO generation_per_type 
@@ -254,67 +322,81 @@ def insert_generation(generation_data):
     VALUES (%s, %s, %s, %s, %s, %s, %s)
     """
     
-    batch = []
-    for g in generation_data:
-        batch.append((
-            g['datetime'], g['area_code'], g['area_name'],
-            g['production_type'], g['output'], g['resolution'], g['month']
-        ))
-    
-    cursor.executemany(insert_sql, batch)
-    conn.commit()
-    inserted = cursor.rowcount
-    cursor.close()
-    conn.close()
+    inserted = 0
+    for i in range(0, len(generation_data), INSERT_BATCH_SIZE):
+        cursor.executemany(insert_sql, generation_data[i:i + INSERT_BATCH_SIZE])
+        inserted += cursor.rowcount
     return inserted
 
+# Per-(country, month) sums and day counts of summary_daily. Averages at every
+# roll-up level are SUM(x_sum) / SUM(x_days), so each level is weighted by days
+# rather than averaging the averages of the level below.
+MONTHLY_ROLLUP_SQL = '''
+    SELECT country, month, SUM(neg_hours) AS neg_hours,
+        SUM(avg_market_price) AS price_sum, COUNT(avg_market_price) AS price_days,
+        SUM(CASE WHEN capture_price > 0 THEN capture_price END) AS capture_sum,
+        COUNT(CASE WHEN capture_price > 0 THEN 1 END) AS capture_days,
+        SUM(CASE WHEN capture_price_floor0 > 0 THEN capture_price_floor0 END) AS floor0_sum,
+        COUNT(CASE WHEN capture_price_floor0 > 0 THEN 1 END) AS floor0_days,
+        SUM(CASE WHEN capture_rate > 0 THEN capture_rate END) AS rate_sum,
+        COUNT(CASE WHEN capture_rate > 0 THEN 1 END) AS rate_days,
+        SUM(CASE WHEN solar_at_neg_price_pct > 0 THEN solar_at_neg_price_pct END) AS solar_sum,
+        COUNT(CASE WHEN solar_at_neg_price_pct > 0 THEN 1 END) AS solar_days
+    FROM summary_daily GROUP BY country, month
+'''
+
+ROLLUP_AVERAGES_SQL = '''
+    ROUND(SUM(price_sum) / NULLIF(SUM(price_days), 0), 2),
+    ROUND(SUM(capture_sum) / NULLIF(SUM(capture_days), 0), 2),
+    ROUND(SUM(floor0_sum) / NULLIF(SUM(floor0_days), 0), 2),
+    ROUND(SUM(rate_sum) / NULLIF(SUM(rate_days), 0), 2),
+    ROUND(SUM(solar_sum) / NULLIF(SUM(solar_days), 0), 2)
+'''
+
 def recalculate_summaries():
     """Recalculate summary tables from daily data"""
     print("\n🔄 Recalculating summary tables...")
     conn = get_db_connection()
     cursor = conn.cursor()
     
+    # Scan summary_daily once; monthly, yearly and total all roll up from this
+    cursor.execute('DROP TEMPORARY TABLE IF EXISTS tmp_monthly_rollup')
+    cursor.execute(f'CREATE TEMPORARY TABLE tmp_monthly_rollup AS {MONTHLY_ROLLUP_SQL}')
+    
     # Rebuild monthly from daily
     cursor.execute('DELETE FROM summary_monthly')
-    cursor.execute('''
+    cursor.execute(f'''
         INSERT INTO summary_monthly (country, month, neg_hours, avg_market_price, 
             capture_price, capture_price_floor0, capture_rate, solar_at_neg_price_pct)
-        SELECT country, month, SUM(neg_hours), ROUND(AVG(avg_market_price), 2),
-            ROUND(AVG(CASE WHEN capture_price > 0 THEN capture_price ELSE NULL END), 2),
-            ROUND(AVG(CASE WHEN capture_price_floor0 > 0 THEN capture_price_floor0 ELSE NULL END), 2),
-            ROUND(AVG(CASE WHEN capture_rate > 0 THEN capture_rate ELSE NULL END), 2),
-            ROUND(AVG(CASE WHEN solar_at_neg_price_pct > 0 THEN solar_at_neg_price_pct ELSE NULL END), 2)
-        FROM summary_daily GROUP BY country, month
+        SELECT country, month, SUM(neg_hours), {ROLLUP_AVERAGES_SQL}
+        FROM tmp_monthly_rollup GROUP BY country, month
     ''')
-    conn.commit()
     print(f"   ✅ Monthly: {cursor.rowcount} rows")
     
     # Rebuild yearly
     cursor.execute('DELETE FROM summary_yearly')
-    cursor.execute('''
+    cursor.execute(f'''
         INSERT INTO summary_yearly (country, total_neg_hours, avg_market_price, 
             capture_price, capture_price_floor0, capture_rate, solar_at_neg_price_pct)
-        SELECT country, SUM(neg_hours), ROUND(AVG(avg_market_price), 2),
-            ROUND(AVG(capture_price), 2), ROUND(AVG(capture_price_floor0), 2),
-            ROUND(AVG(capture_rate), 2), ROUND(AVG(solar_at_neg_price_pct), 2)
-        FROM summary_monthly GROUP BY country
+        SELECT country, SUM(neg_hours), {ROLLUP_AVERAGES_SQL}
+        FROM tmp_monthly_rollup GROUP BY country
     ''')
-    conn.commit()
     print(f"   ✅ Yearly: {cursor.rowcount} rows")
     
     # Rebuild total
     cursor.execute('DELETE FROM summary_total')
-    cursor.execute('''
+    cursor.execute(f'''
         INSERT INTO summary_total (id, total_neg_hours, avg_market_price, 
             capture_price, capture_price_floor0, capture_rate, solar_at_neg_price_pct)
-        SELECT 1, SUM(total_neg_hours), ROUND(AVG(avg_market_price), 2),
-            ROUND(AVG(capture_price), 2), ROUND(AVG(capture_price_floor0), 2),
-            ROUND(AVG(capture_rate), 2), ROUND(AVG(solar_at_neg_price_pct), 2)
-        FROM summary_yearly
+        SELECT 1, SUM(neg_hours), {ROLLUP_AVERAGES_SQL}
+        FROM tmp_monthly_rollup
     ''')
-    conn.commit()
     print("   ✅ Total updated")
     
+    # Monthly, yearly and total become visible together
+    conn.commit()
+    
+    cursor.execute('DROP TEMPORARY TABLE tmp_monthly_rollup')
     cursor.close()
     conn.close()
 
@@ -322,34 +404,41 @@ def recalculate_summaries():
 # MAIN UPDATE FUNCTIONS
 # =============================================================================
 
+def fetch_zone(area_code, start_date, end_date):
+    """Fetch prices and solar generation for one bidding zone"""
+    prices = fetch_day_ahead_prices(area_code, start_date, end_date)
+    gen_data = fetch_generation(area_code, 'B16', start_date, end_date)  # Solar only for now
+    return prices, gen_data
+
 def daily_update():
     """Fetch last 31 days to catch any delays"""
     print("\n📅 Daily Update: Fetching last 31 days")
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=31)
     
-    total_prices = 0
-    total_gen = 0
+    all_prices = []
+    all_gen = []
     
-    for area_code, area_name in BIDDING_ZONES.items():
-        print(f"   {area_name}...", end='', flush=True)
-        
-        # Fetch prices
-        prices = fetch_day_ahead_prices(area_code, start_date, end_date)
-        if prices:
-            inserted = insert_prices(prices)
-            total_prices += inserted
-            print(f" P:{inserted}", end='', flush=True)
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        futures = {
+            executor.submit(fetch_zone, area_code, start_date, end_date): area_name
+            for area_code, area_name in BIDDING_ZONES.items()
+        }
         
-        # Fetch generation (Solar only for now)
-        gen_data = fetch_generation(area_code, 'B16', start_date, end_date)
-        if gen_data:
-            inserted = insert_generation(gen_data)
-            total_gen += inserted
-            print(f" G:{inserted}", end='', flush=True)
-        
-        print()  # New line
-        time.sleep(0.3)  # Rate limiting
+        for future in as_completed(futures):
+            prices, gen_data = future.result()
+            all_prices.extend(prices)
+            all_gen.extend(gen_data)
+            print(f"   {futures[future]}... P:{len(prices)} G:{len(gen_data)}", flush=True)
+    
+    # One insert pass per table and a single commit for the whole run
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    total_prices = insert_prices(cursor, all_prices)
+    total_gen = insert_generation(cursor, all_gen)
+    conn.commit()
+    cursor.close()
+    conn.close()
     
     print(f"\n   Total: {total_prices} price records, {total_gen} generation records")
     
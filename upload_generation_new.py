@@ -5,10 +5,12 @@ Upload new Generation per Type data to Google Cloud SQL
 - Replaces old data in generation_per_type table
 """
 
-import mysql.connector
+from mysql.connector import pooling
 import csv
+import io
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 # Force unbuffered output
@@ -21,7 +23,6 @@ DB_CONFIG = {
     'user': 'root',
     'password': 'YourSecurePassword123!',
     'database': 'energy_market',
-    'use_pure': True,
     'connection_timeout': 300,
     'autocommit': False,
 }
@@ -31,52 +32,39 @@ DATA_DIR = Path(__file__).parent / "Generation_per_type_new"
 
 # Production types to keep
 KEEP_TYPES = ['Solar', 'Wind Onshore', 'Wind Offshore']
+KEEP_TYPES_SET = frozenset(KEEP_TYPES)
 
-BATCH_SIZE = 1000  # Smaller batches for stability
+# CSV columns read by upload_file, in generation_per_type insert order
+CSV_COLUMNS = (
+    'DateTime(UTC)', 'ResolutionCode', 'AreaCode', 'AreaDisplayName',
+    'AreaTypeCode', 'AreaMapCode', 'ProductionType',
+    'ActualGenerationOutput[MW]', 'ActualConsumption[MW]', 'UpdateTime(UTC)',
+)
 
+# Rows per multi-row INSERT; ~1 MB per statement, well under max_allowed_packet
+BATCH_SIZE = 5000
 
-def get_connection():
-    """Get database connection"""
-    print("   Attempting connection...")
-    conn = mysql.connector.connect(**DB_CONFIG)
-    print("   Connection established!")
-    return conn
+# Read generation CSVs in 1 MiB chunks rather than the default 8 KiB
+READ_BUFFER_SIZE = 1 << 20
 
+# Files uploaded concurrently, each on its own connection. CSV parsing holds the
+# GIL, so it still runs on one core; only the DB round trips overlap.
+UPLOAD_WORKERS = 4
 
-def recreate_table(cursor):
-    """Drop and recreate the generation_per_type table with correct schema"""
-    print("📋 Recreating generation_per_type table...")
-    
-    print("   Dropping old table...")
-    cursor.execute("DROP TABLE IF EXISTS generation_per_type")
-    print("   Old table dropped.", flush=True)
-    
-    print("   Creating new table...", flush=True)
-    cursor.execute("""
-        CREATE TABLE generation_per_type (
-            id BIGINT AUTO_INCREMENT PRIMARY KEY,
-            `DateTime(UTC)` VARCHAR(50) NOT NULL,
-            ResolutionCode VARCHAR(20),
-            AreaCode VARCHAR(50) NOT NULL,
-            AreaDisplayName VARCHAR(100),
-            AreaTypeCode VARCHAR(20),
-            AreaMapCode VARCHAR(20),
-            ProductionType VARCHAR(100) NOT NULL,
-            ActualGenerationOutput DECIMAL(14, 4),
-            ActualConsumption DECIMAL(14, 4),
-            `UpdateTime(UTC)` VARCHAR(50),
-            source_month TINYINT NOT NULL,
-            
-            INDEX idx_datetime (`DateTime(UTC)`),
-            INDEX idx_area_code (AreaCode),
-            INDEX idx_area_display (AreaDisplayName),
-            INDEX idx_production_type (ProductionType),
-            INDEX idx_month (source_month),
-            INDEX idx_area_datetime (AreaCode, `DateTime(UTC)`),
-            INDEX idx_solar (ProductionType, ActualGenerationOutput)
-        ) ENGINE=InnoDB
-    """)
-    print("   ✅ Table created", flush=True)
+
+_pool = None
+
+
+def get_connection():
+    """Get a pooled database connection; close() returns it to the pool"""
+    global _pool
+    if _pool is None:
+        print("   Attempting connection...")
+        # One connection for main() plus one per upload worker
+        _pool = pooling.MySQLConnectionPool(
+            pool_name='generation_upload', pool_size=UPLOAD_WORKERS + 1, **DB_CONFIG)
+        print("   Connection established!")
+    return _pool.get_connection()
 
 
 def create_table_fresh(conn):
@@ -91,8 +79,8 @@ def create_table_fresh(conn):
     print("   Creating new table...", flush=True)
     cursor.execute("""
         CREATE TABLE generation_per_type (
-            id BIGINT AUTO_INCREMENT PRIMARY KEY,
-            `DateTime(UTC)` VARCHAR(50) NOT NULL,
+            id BIGINT AUTO_INCREMENT,
+            `DateTime(UTC)` DATETIME NOT NULL,
             ResolutionCode VARCHAR(20),
             AreaCode VARCHAR(50) NOT NULL,
             AreaDisplayName VARCHAR(100),
@@ -101,24 +89,57 @@ def create_table_fresh(conn):
             ProductionType VARCHAR(100) NOT NULL,
             ActualGenerationOutput DECIMAL(14, 4),
             ActualConsumption DECIMAL(14, 4),
-            `UpdateTime(UTC)` VARCHAR(50),
+            `UpdateTime(UTC)` DATETIME,
             source_month TINYINT NOT NULL,
+            date_utc DATE GENERATED ALWAYS AS (DATE(`DateTime(UTC)`)) STORED,
             
-            INDEX idx_datetime (`DateTime(UTC)`),
-            INDEX idx_area_code (AreaCode),
-            INDEX idx_area_display (AreaDisplayName),
-            INDEX idx_production_type (ProductionType),
-            INDEX idx_month (source_month)
+            PRIMARY KEY (id, source_month)
         ) ENGINE=InnoDB
+        PARTITION BY RANGE (source_month) (
+            PARTITION p1 VALUES LESS THAN (2),
+            PARTITION p2 VALUES LESS THAN (3),
+            PARTITION p3 VALUES LESS THAN (4),
+            PARTITION p4 VALUES LESS THAN (5),
+            PARTITION p5 VALUES LESS THAN (6),
+            PARTITION p6 VALUES LESS THAN (7),
+            PARTITION p7 VALUES LESS THAN (8),
+            PARTITION p8 VALUES LESS THAN (9),
+            PARTITION p9 VALUES LESS THAN (10),
+            PARTITION p10 VALUES LESS THAN (11),
+            PARTITION p11 VALUES LESS THAN (12),
+            PARTITION p12 VALUES LESS THAN MAXVALUE
+        )
     """)
     conn.commit()
     cursor.close()
     print("   ✅ Table created and committed", flush=True)
 
 
+def create_indexes(conn):
+    """Build secondary indexes once the data is loaded, in a single table pass"""
+    cursor = conn.cursor()
+    
+    print("   Building indexes...", flush=True)
+    cursor.execute("""
+        ALTER TABLE generation_per_type
+            ADD INDEX idx_datetime (`DateTime(UTC)`),
+            ADD INDEX idx_area_display (AreaDisplayName),
+            ADD INDEX idx_production_type (ProductionType),
+            ADD INDEX idx_area_month_type (AreaCode, source_month, ProductionType,
+                                           `DateTime(UTC)`, ActualGenerationOutput),
+            ADD INDEX idx_area_month_date (AreaCode, source_month, date_utc)
+    """)
+    cursor.close()
+    print("   ✅ Indexes built", flush=True)
+
+
+# CSV markers for a missing value ('n/e' = not expected)
+MISSING_VALUES = frozenset(('', 'n/e'))
+
+
 def parse_float(value):
     """Parse float value, return None for empty strings"""
-    if value is None or value == '' or value == 'n/e':
+    if value in MISSING_VALUES:
         return None
     try:
         return float(value)
@@ -135,36 +156,53 @@ def upload_file(cursor, conn, filepath, month):
     total_rows = 0
     filtered_rows = 0
     
-    with open(filepath, 'r', encoding='utf-8') as f:
-        # Detect delimiter (tab or comma)
-        first_line = f.readline()
-        f.seek(0)
-        delimiter = '\t' if '\t' in first_line else ','
+    with open(filepath, 'rb', buffering=READ_BUFFER_SIZE) as raw:
+        # Detect delimiter (tab or comma) from the buffered header bytes
+        first_line = raw.peek(4096).split(b'\n', 1)[0]
+        delimiter = '\t' if b'\t' in first_line else ','
         
-        reader = csv.DictReader(f, delimiter=delimiter)
+        # utf-8-sig drops a leading BOM so the first header name still matches
+        f = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+        reader = csv.reader(f, delimiter=delimiter)
+        
+        # Resolve column positions once from the header
+        header = next(reader, None)
+        if header is None:
+            print(f"      ⚠️  {filename} is empty, skipping")
+            return 0
+        missing = [name for name in CSV_COLUMNS if name not in header]
+        if missing:
+            raise ValueError(f"{filename} is missing columns: {', '.join(missing)}")
+        columns = [header.index(name) for name in CSV_COLUMNS]
+        (dt_col, res_col, area_col, display_col, type_col, map_col, prod_col,
+         gen_col, cons_col, update_col) = columns
+        min_row_len = max(columns) + 1
         
         for row in reader:
+            # Skip blank lines and truncated rows
+            if len(row) < min_row_len:
+                continue
             total_rows += 1
             
-            # Filter for Solar and Wind only
-            production_type = row.get('ProductionType', '')
-            if production_type not in KEEP_TYPES:
+            # Filter for Solar and Wind only, before touching any other column
+            production_type = row[prod_col]
+            if production_type not in KEEP_TYPES_SET:
                 continue
             
             filtered_rows += 1
             
             # Prepare row data
             row_data = (
-                row.get('DateTime(UTC)', ''),
-                row.get('ResolutionCode', ''),
-                row.get('AreaCode', ''),
-                row.get('AreaDisplayName', ''),
-                row.get('AreaTypeCode', ''),
-                row.get('AreaMapCode', ''),
+                row[dt_col],
+                row[res_col],
+                row[area_col],
+                row[display_col],
+                row[type_col],
+                row[map_col],
                 production_type,
-                parse_float(row.get('ActualGenerationOutput[MW]')),
-                parse_float(row.get('ActualConsumption[MW]')),
-                row.get('UpdateTime(UTC)', ''),
+                parse_float(row[gen_col]),
+                parse_float(row[cons_col]),
+                row[update_col] or None,
                 month
             )
             
@@ -173,19 +211,29 @@ def upload_file(cursor, conn, filepath, month):
             # Batch insert
             if len(rows_to_insert) >= BATCH_SIZE:
                 insert_batch(cursor, rows_to_insert)
-                conn.commit()
-                print(f"      ... inserted {filtered_rows:,} rows so far", flush=True)
+                print(f"      ... {filename}: inserted {filtered_rows:,} rows so far", flush=True)
                 rows_to_insert = []
     
-    # Insert remaining rows
+    # Insert remaining rows; the whole file is committed at once
     if rows_to_insert:
         insert_batch(cursor, rows_to_insert)
-        conn.commit()
+    conn.commit()
     
-    print(f"      Total: {total_rows:,} rows, Kept (Solar/Wind): {filtered_rows:,} rows")
+    print(f"      {filename}: {total_rows:,} rows, Kept (Solar/Wind): {filtered_rows:,} rows")
     return filtered_rows
 
 
+def upload_file_worker(filepath, month):
+    """Upload a single CSV file on a dedicated connection (runs in a worker thread)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        return upload_file(cursor, conn, filepath, month)
+    finally:
+        cursor.close()
+        conn.close()
+
+
 def insert_batch(cursor, rows):
     """Insert a batch of rows"""
     if not rows:
@@ -232,12 +280,13 @@ def main():
     create_table_fresh(conn)
     print()
     
-    # Get fresh cursor for inserts
+    # Get fresh cursor for verification
     cursor = conn.cursor()
     
-    # Upload each file
+    # Upload files concurrently; each month lands in its own partition
     print("📤 Uploading data...")
     total_inserted = 0
+    uploads = []
     
     for filepath in csv_files:
         # Extract month from filename (e.g., 2025_01_... -> 1)
@@ -247,9 +296,17 @@ def main():
         except (IndexError, ValueError):
             print(f"   ⚠️  Could not parse month from {filename}, skipping")
             continue
-        
-        rows = upload_file(cursor, conn, filepath, month)
-        total_inserted += rows
+        uploads.append((filepath, month))
+    
+    executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
+    futures = [executor.submit(upload_file_worker, filepath, month)
+               for filepath, month in uploads]
+    try:
+        for future in as_completed(futures):
+            total_inserted += future.result()
+    finally:
+        # On the first failure, drop the files that have not started yet
+        executor.shutdown(cancel_futures=True)
     
     print()
     print("=" * 60)
@@ -257,31 +314,34 @@ def main():
     print(f"   Total rows inserted: {total_inserted:,}")
     print("=" * 60)
     
+    # Indexes are added after the load so inserts skip per-row B-tree upkeep
+    print()
+    create_indexes(conn)
+    
     # Verify
     print()
     print("📊 Verification:")
-    cursor.execute("SELECT COUNT(*) FROM generation_per_type")
-    count = cursor.fetchone()[0]
-    print(f"   Total rows in table: {count:,}")
-    
+    # One scan of the table; the three breakdowns are summed from it here
     cursor.execute("""
-        SELECT ProductionType, COUNT(*) as cnt 
+        SELECT ProductionType, source_month, COUNT(*) as cnt 
         FROM generation_per_type 
-        GROUP BY ProductionType
+        GROUP BY ProductionType, source_month
     """)
+    by_type = {}
+    by_month = {}
+    for production_type, month, cnt in cursor.fetchall():
+        by_type[production_type] = by_type.get(production_type, 0) + cnt
+        by_month[month] = by_month.get(month, 0) + cnt
+    
+    print(f"   Total rows in table: {sum(by_type.values()):,}")
+    
     print("   By production type:")
-    for row in cursor.fetchall():
-        print(f"      {row[0]}: {row[1]:,}")
+    for production_type, cnt in by_type.items():
+        print(f"      {production_type}: {cnt:,}")
     
-    cursor.execute("""
-        SELECT source_month, COUNT(*) as cnt 
-        FROM generation_per_type 
-        GROUP BY source_month 
-        ORDER BY source_month
-    """)
     print("   By month:")
-    for row in cursor.fetchall():
-        print(f"      Month {row[0]}: {row[1]:,}")
+    for month in sorted(by_month):
+        print(f"      Month {month}: {by_month[month]:,}")
     
     cursor.close()
     conn.close()